@@ -0,0 +1,112 @@
+import os
+from fnmatch import fnmatch
+from configparser import ConfigParser
+from logger import logger
+
+
+class BatchScheduler:
+    def __init__(self):
+        config = self._read_config()
+        self.enabled = config.getboolean("Scheduler", "enabled", fallback=True)
+        self.priority_rules = self._parse_priority_rules(config.get("Scheduler", "priority_rules", fallback=""))
+        self.small_file_kb = config.getint("Scheduler", "small_file_kb", fallback=256)
+        self.max_batch_files = config.getint("Scheduler", "max_batch_files", fallback=50)
+        self.max_batch_seconds = config.getfloat("Scheduler", "max_batch_seconds", fallback=120)
+        self.throughput_kb_per_second = config.getfloat("Scheduler", "throughput_kb_per_second", fallback=500)
+        if self.throughput_kb_per_second <= 0:
+            logger.warning(
+                f"Некорректное значение throughput_kb_per_second: {self.throughput_kb_per_second}. "
+                f"Используется значение по умолчанию 500."
+            )
+            self.throughput_kb_per_second = 500
+        self.file_overhead_seconds = config.getfloat("Scheduler", "file_overhead_seconds", fallback=2)
+
+    def _read_config(self):
+        """Читает настройки из config.ini."""
+        config = ConfigParser()
+        config.read("config.ini", encoding="utf-8")
+        return config
+
+    def _parse_priority_rules(self, raw_rules):
+        """Разбирает правила вида 'шаблон:приоритет, шаблон:приоритет'."""
+        rules = []
+        for rule in raw_rules.split(","):
+            rule = rule.strip()
+            if not rule:
+                continue
+            pattern, _, priority = rule.rpartition(":")
+            try:
+                rules.append((pattern.strip(), int(priority)))
+            except ValueError:
+                logger.warning(f"Некорректное правило приоритета пропущено: {rule}")
+        return rules
+
+    def get_priority(self, file_name):
+        """Возвращает приоритет файла по первому подходящему правилу (по умолчанию 0)."""
+        for pattern, rule_priority in self.priority_rules:
+            if fnmatch(file_name.lstrip("+").lower(), pattern.lower()):
+                return rule_priority
+        return 0
+
+    def get_group(self, file_name, file_size):
+        """
+        Возвращает группу файла: приоритет по правилам и класс размера (0 — малый, 1 — крупный).
+        Группы определяют порядок пакетов; файлы разных групп не смешиваются в одном пакете.
+        """
+        size_class = 0 if file_size <= self.small_file_kb * 1024 else 1
+        return -self.get_priority(file_name), size_class
+
+    def estimate_seconds(self, file_size):
+        """Оценивает длительность обработки файла утилитой sdexch1c."""
+        return self.file_overhead_seconds + file_size / 1024 / self.throughput_kb_per_second
+
+    def plan_batches(self, folder, dat_files):
+        """
+        Упорядочивает файлы по приоритету, размеру и возрасту и делит их на пакеты.
+        Файлы разных групп (приоритет и класс размера) не попадают в один пакет,
+        поэтому срочные документы не ждут окончания обработки крупных выгрузок.
+        Внутри группы первыми идут более старые, затем меньшие файлы.
+        :return: список пакетов, каждый — список имён файлов
+        """
+        if not self.enabled:
+            return [list(dat_files)] if dat_files else []
+
+        entries = []
+        for file_name in dat_files:
+            file_path = os.path.join(folder, file_name)
+            try:
+                stat = os.stat(file_path)
+            except OSError as e:
+                logger.warning(f"Не удалось получить сведения о файле {file_name}: {e}")
+                continue
+            group = self.get_group(file_name, stat.st_size)
+            entries.append((group, stat.st_mtime, stat.st_size, file_name))
+
+        entries.sort()
+
+        batches = []
+        current_batch = []
+        current_group = None
+        current_seconds = 0
+        for group, _, file_size, file_name in entries:
+            file_seconds = self.estimate_seconds(file_size)
+            if current_batch and (
+                group != current_group
+                or len(current_batch) >= self.max_batch_files
+                or current_seconds + file_seconds > self.max_batch_seconds
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_seconds = 0
+
+            current_batch.append(file_name)
+            current_group = group
+            current_seconds += file_seconds
+
+        if current_batch:
+            batches.append(current_batch)
+
+        logger.info(f"Сформировано пакетов: {len(batches)} для {len(entries)} файл(ов).")
+        for number, batch in enumerate(batches, start=1):
+            logger.info(f"Пакет {number}: {batch}")
+        return batches
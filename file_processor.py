@@ -1,8 +1,11 @@
 import os
+import time
+import shutil
 import asyncio
 from configparser import ConfigParser
 import subprocess
 from logger import logger
+from batch_scheduler import BatchScheduler
 
 
 class FileProcessor:
@@ -10,6 +13,13 @@ class FileProcessor:
         config = self._read_config()
         self.local_input_path = config.get("Paths", "local_input_path", fallback="./data/incoming")
         self.sdexch_exe_path = config.get("Paths", "sdexch_exe_path", fallback="D:/Sel2/sdexch1c/sdexch1c.exe")
+        self.local_batch_path = config.get("Paths", "local_batch_path", fallback="./data/batch")
+        self.refresh_between_batches = config.getboolean("Scheduler", "refresh_between_batches", fallback=True)
+        self.max_refresh_rounds = config.getint("Scheduler", "max_refresh_rounds", fallback=5)
+        self.refresh_time_budget_seconds = config.getfloat("Scheduler", "refresh_time_budget_minutes", fallback=30) * 60
+        self.batch_settle_seconds = config.getfloat("Scheduler", "batch_settle_seconds", fallback=10)
+        self.batch_settle_timeout_seconds = config.getfloat("Scheduler", "batch_settle_timeout_seconds", fallback=60)
+        self.scheduler = BatchScheduler()
 
     def _read_config(self):
         """Читает настройки из config.ini."""
@@ -17,8 +27,15 @@ class FileProcessor:
         config.read("config.ini", encoding="utf-8")
         return config
     
-    async def process_files(self):
-        """Запускает обработку файлов через внешний exe-файл."""
+    async def process_files(self, fetch_new_files=None, ensure_ready=None):
+        """
+        Запускает обработку файлов через внешний exe-файл пакетами.
+        После каждого пакета вызывается fetch_new_files (если задан), и оставшиеся
+        файлы планируются заново, чтобы срочные новые файлы не ждали крупных пакетов.
+        Если fetch_new_files вернул False или завершился ошибкой, до конца цикла он больше не вызывается.
+        Число таких проверок и их общее время ограничены, чтобы цикл завершался.
+        Перед каждым следующим пакетом вызывается ensure_ready (если задан) — проверка готовности SELEX.
+        """
         if not os.path.exists(self.sdexch_exe_path):
             logger.error(f"Утилита обработки не найдена: {self.sdexch_exe_path}")
             return
@@ -33,11 +50,131 @@ class FileProcessor:
 
         logger.info(f"Начинается обработка файлов через утилиту: {self.sdexch_exe_path}")
 
+        # Возвращаем файлы, оставшиеся в папке пакета после прерванного запуска
+        self._unstage_batch()
+
+        processed_files = set()
+        number = 0
+        refresh_rounds = 0
+        refresh_deadline = time.monotonic() + self.refresh_time_budget_seconds
+        while True:
+            batches = self.scheduler.plan_batches(self.local_input_path, self._pending_files(processed_files))
+            if not batches:
+                break
+
+            batch = batches[0]
+            processed_files.update(batch)
+            number += 1
+
+            if number > 1 and ensure_ready:
+                await ensure_ready()
+
+            # Единственный пакет обрабатываем на месте, без промежуточной папки
+            if number == 1 and len(batches) == 1:
+                try:
+                    await self._run_sdexch_tool()
+                    logger.info("Все файлы успешно обработаны.")
+                except Exception as e:
+                    logger.error(f"Ошибка при запуске обработки файлов: {e}")
+            else:
+                await self._process_batch(number, batch, len(batches) - 1)
+
+            if fetch_new_files and self.refresh_between_batches:
+                if refresh_rounds >= self.max_refresh_rounds or time.monotonic() >= refresh_deadline:
+                    logger.info("Лимит проверок новых файлов в этом цикле исчерпан; новые файлы будут обработаны в следующем цикле.")
+                    fetch_new_files = None
+                    continue
+                refresh_rounds += 1
+                try:
+                    refreshed = await fetch_new_files()
+                except Exception as e:
+                    logger.error(f"Ошибка при проверке новых файлов между пакетами: {e}")
+                    refreshed = False
+                # После сбоя не тратим время на повторные подключения: следующие пакеты запускаются сразу
+                if refreshed is False:
+                    logger.warning("Проверка новых файлов не удалась; до конца цикла FTP повторно не проверяется.")
+                    fetch_new_files = None
+
+    def _pending_files(self, processed_files):
+        """
+        Возвращает файлы .dat, ожидающие обработки. Файлы с префиксом "+" уже обработаны утилитой,
+        остальные файлы, уже побывавшие в пакете этого цикла, повторно не запускаются.
+        """
+        return [
+            f for f in os.listdir(self.local_input_path)
+            if f.endswith(".dat") and not f.startswith("+") and f not in processed_files
+        ]
+
+    async def _process_batch(self, number, batch, remaining):
+        """Обрабатывает один пакет в промежуточной папке и возвращает результаты в local_input_path."""
+        logger.info(f"Обработка пакета {number} ({len(batch)} файл(ов), в очереди ещё пакетов: {remaining})...")
+        tool_started = False
         try:
-            await self._run_sdexch_tool()
-            logger.info("Все файлы успешно обработаны.")
+            self._stage_batch(batch)
+            tool_started = True
+            await self._run_sdexch_tool(self.local_batch_path)
+            logger.info(f"Пакет {number} успешно обработан.")
         except Exception as e:
-            logger.error(f"Ошибка при запуске обработки файлов: {e}")
+            logger.error(f"Ошибка при обработке пакета {number}: {e}")
+        finally:
+            if tool_started:
+                await self._wait_for_batch_results()
+            self._unstage_batch()
+
+    def _stage_batch(self, batch):
+        """Переносит файлы пакета в промежуточную папку для отдельного запуска утилиты."""
+        os.makedirs(self.local_batch_path, exist_ok=True)
+        for file_name in batch:
+            shutil.move(
+                os.path.join(self.local_input_path, file_name),
+                os.path.join(self.local_batch_path, file_name),
+            )
+
+    def _batch_snapshot(self):
+        """Возвращает состояние файлов в папке пакета: {имя: (размер, время изменения)}."""
+        snapshot = {}
+        for file_name in os.listdir(self.local_batch_path):
+            file_path = os.path.join(self.local_batch_path, file_name)
+            if os.path.isfile(file_path):
+                stat = os.stat(file_path)
+                snapshot[file_name] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    async def _wait_for_batch_results(self):
+        """
+        Ожидает, пока утилита допишет файлы результатов и предупреждений:
+        содержимое папки пакета должно не меняться batch_settle_seconds секунд
+        (но не дольше batch_settle_timeout_seconds).
+        """
+        poll_interval = min(1, self.batch_settle_seconds)
+        deadline = time.monotonic() + self.batch_settle_timeout_seconds
+        snapshot = self._batch_snapshot()
+        stable_since = time.monotonic()
+
+        while time.monotonic() - stable_since < self.batch_settle_seconds:
+            if time.monotonic() >= deadline:
+                logger.warning("Файлы в папке пакета продолжают меняться, ожидание прекращено по тайм-ауту.")
+                return
+            await asyncio.sleep(poll_interval)
+            current = self._batch_snapshot()
+            if current != snapshot:
+                snapshot = current
+                stable_since = time.monotonic()
+
+    def _unstage_batch(self):
+        """Возвращает файлы пакета и результаты обработки в папку local_input_path для анализа."""
+        if not os.path.exists(self.local_batch_path):
+            return
+        for file_name in os.listdir(self.local_batch_path):
+            if not os.path.isfile(os.path.join(self.local_batch_path, file_name)):
+                continue
+            try:
+                shutil.move(
+                    os.path.join(self.local_batch_path, file_name),
+                    os.path.join(self.local_input_path, file_name),
+                )
+            except Exception as e:
+                logger.error(f"Ошибка при возврате файла {file_name} из папки пакета: {e}")
 
     def _has_dat_files(self):
         """Проверяет, есть ли файлы .dat в папке local_input_path."""
@@ -46,9 +183,9 @@ class FileProcessor:
             logger.info(f"Обнаружено {len(dat_files)} файл(ов) .dat для обработки в {self.local_input_path}.")
         return bool(dat_files)
 
-    async def _run_sdexch_tool(self):
-        """Запускает sdexch1c.exe с локальной папкой как аргумент."""
-        command = [self.sdexch_exe_path, self.local_input_path]
+    async def _run_sdexch_tool(self, input_path=None):
+        """Запускает sdexch1c.exe с локальной папкой (по умолчанию local_input_path) как аргумент."""
+        command = [self.sdexch_exe_path, input_path or self.local_input_path]
     
         # Запуск внешнего процесса
         process = await asyncio.create_subprocess_exec(
@@ -0,0 +1,347 @@
+import os
+import re
+import mmap
+import codecs
+import shutil
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+from logger import logger
+from notifier import Notifier
+
+UTF8_BOM = b"\xef\xbb\xbf"
+
+# Байты cp1251, ожидаемые в текстовом файле обмена: ASCII, кириллица и распространённая типографика.
+# Доля остальных байтов показывает, что файл записан в другой кодировке.
+_EXPECTED_CP1251_BYTES = (
+    b"\t\n\r"
+    + bytes(range(0x20, 0x7F))
+    + bytes(range(0xC0, 0x100))
+    + bytes([
+        0x84, 0x85, 0x91, 0x92, 0x93, 0x94, 0x96, 0x97,  # „ … ‘ ’ “ ” – —
+        0xA0, 0xA7, 0xAB, 0xB0, 0xB9, 0xBB,  # NBSP § « ° № »
+        0xA1, 0xA2, 0xA5, 0xA8, 0xAA, 0xAF,  # Ў ў Ґ Ё Є Ї
+        0xB2, 0xB3, 0xB4, 0xB8, 0xBA, 0xBF,  # І і ґ ё є ї
+    ])
+)
+
+
+def _iter_chunks(file_path, file_size, chunk_size, mmap_threshold):
+    """Поблочно читает файл; крупные файлы отображаются в память через mmap."""
+    with open(file_path, "rb") as f:
+        if file_size >= mmap_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset in range(0, file_size, chunk_size):
+                    yield mm[offset:offset + chunk_size]
+        else:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+
+def _read_tail(file_path, length, chunk_size):
+    """
+    Возвращает последние length байт файла без завершающих пробельных символов.
+    Файл читается блоками с конца, пока не наберётся нужное количество значащих байт.
+    """
+    with open(file_path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0:
+            read_size = min(chunk_size, position)
+            position -= read_size
+            f.seek(position)
+            tail = (f.read(read_size) + tail).rstrip()
+            if len(tail) >= length:
+                break
+        return tail[-length:]
+
+
+def _read_head(file_path, length):
+    """Возвращает первые length байт файла."""
+    with open(file_path, "rb") as f:
+        return f.read(length)
+
+
+def _validate_file(file_path, expected_size, rules):
+    """
+    Проверяет один файл .dat. Возвращает None, если файл корректен,
+    иначе — строку с причиной отказа.
+    Функция верхнего уровня, чтобы её можно было выполнять в пуле процессов.
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+    except OSError as e:
+        return f"Не удалось получить размер файла: {e}"
+
+    if file_size == 0:
+        return "Файл пуст (0 байт)."
+    if expected_size is not None and file_size != expected_size:
+        return f"Размер файла {file_size} байт не совпадает с размером на FTP {expected_size} байт (файл обрезан или загружен не полностью)."
+    if file_size < rules["min_size_bytes"]:
+        return f"Размер файла {file_size} байт меньше минимально допустимого {rules['min_size_bytes']} байт."
+
+    header = rules["header"]
+    footer = rules["footer"]
+    max_line_length = rules["max_line_length"]
+    line_pattern = rules["line_pattern"]
+
+    try:
+        if _read_head(file_path, len(UTF8_BOM)) == UTF8_BOM:
+            return "Файл начинается с метки UTF-8 (BOM), ожидается кодировка cp1251."
+    except OSError as e:
+        return f"Ошибка чтения файла: {e}"
+
+    decoder = codecs.getincrementaldecoder("cp1251")(errors="strict")
+    utf8_decoder = codecs.getincrementaldecoder("utf-8")(errors="strict")
+    utf8_valid = True
+    has_non_ascii = False
+    unexpected_bytes = 0
+    cp1251_error = None
+    # Структурные ошибки не прерывают чтение: сначала нужно убедиться,
+    # что причина отказа не в кодировке файла
+    structure_error = None
+    check_lines = bool(max_line_length or line_pattern)
+    offset = 0
+    newline_count = 0
+    line_number = 1
+    current_line = b""
+    head = b""
+    last_byte = b""
+
+    try:
+        for chunk in _iter_chunks(file_path, file_size, rules["chunk_size"], rules["mmap_threshold"]):
+            if not has_non_ascii and not chunk.isascii():
+                has_non_ascii = True
+            if utf8_valid:
+                try:
+                    utf8_decoder.decode(chunk)
+                except UnicodeDecodeError:
+                    utf8_valid = False
+            unexpected_bytes += len(chunk.translate(None, _EXPECTED_CP1251_BYTES))
+            if cp1251_error is None:
+                try:
+                    decoder.decode(chunk)
+                except UnicodeDecodeError as e:
+                    cp1251_error = f"Файл не декодируется в cp1251: недопустимый байт 0x{chunk[e.start]:02X} на позиции {offset + e.start}."
+
+            if len(head) < len(header):
+                head += chunk[:len(header) - len(head)]
+
+            if check_lines and structure_error is None:
+                lines = (current_line + chunk).split(b"\n")
+                current_line = lines.pop()
+                for line in lines:
+                    structure_error = _check_line(line, line_number, max_line_length, line_pattern)
+                    if structure_error:
+                        break
+                    line_number += 1
+                if not structure_error and max_line_length and len(current_line.rstrip(b"\r")) > max_line_length:
+                    structure_error = f"Строка {line_number} длиннее {max_line_length} символов."
+                # Незавершённая строка копируется с каждым блоком, поэтому её размер ограничен
+                if not structure_error and len(current_line) > rules["line_buffer_limit"]:
+                    structure_error = (
+                        f"Строка {line_number} длиннее {rules['line_buffer_limit']} байт "
+                        f"(нет перевода строки, структура файла нарушена)."
+                    )
+                if structure_error:
+                    current_line = b""
+
+            newline_count += chunk.count(b"\n")
+            last_byte = chunk[-1:]
+            offset += len(chunk)
+        if utf8_valid:
+            try:
+                utf8_decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                utf8_valid = False
+
+        if check_lines and current_line and structure_error is None:
+            structure_error = _check_line(current_line, line_number, max_line_length, line_pattern)
+
+        if structure_error is None and header and head != header:
+            structure_error = f"Отсутствует маркер заголовка «{rules['header_marker']}» в начале файла."
+
+        if structure_error is None and footer:
+            if _read_tail(file_path, len(footer), rules["chunk_size"]) != footer:
+                structure_error = f"Отсутствует маркер окончания «{rules['footer_marker']}» в конце файла (файл, вероятно, обрезан)."
+    except OSError as e:
+        return f"Ошибка чтения файла: {e}"
+
+    # Проверки кодировки: файл в UTF-8, затем строгое декодирование cp1251
+    # (точная позиция недопустимого байта) и доля нетипичных для cp1251 байтов
+    if utf8_valid and has_non_ascii:
+        return "Файл записан в кодировке UTF-8, ожидается cp1251."
+    if cp1251_error:
+        return cp1251_error
+    max_unexpected_percent = rules["max_unexpected_percent"]
+    if max_unexpected_percent and unexpected_bytes * 100 > max_unexpected_percent * file_size:
+        return (
+            f"Файл, вероятно, записан не в cp1251: {unexpected_bytes * 100 / file_size:.1f}% байтов "
+            f"не относятся к кириллице, ASCII и типографским знакам (допустимо {max_unexpected_percent}%)."
+        )
+
+    if structure_error:
+        return structure_error
+
+    line_count = newline_count + (0 if last_byte == b"\n" else 1)
+    if line_count < rules["min_lines"]:
+        return f"В файле {line_count} строк, ожидается не менее {rules['min_lines']}."
+
+    return None
+
+
+def _check_line(line, line_number, max_line_length, line_pattern):
+    """Проверяет одну строку файла по структурным правилам."""
+    line = line.rstrip(b"\r")
+    if max_line_length and len(line) > max_line_length:
+        return f"Строка {line_number} длиннее {max_line_length} символов."
+    if line_pattern and line.strip() and not line_pattern.match(line):
+        return f"Строка {line_number} не соответствует шаблону структуры файла."
+    return None
+
+
+class FileValidator:
+    def __init__(self):
+        config = self._read_config()
+        self.local_input_path = config.get("Paths", "local_input_path", fallback="./data/incoming")
+        self.local_problem_path = config.get("Paths", "local_problem_path", fallback="./data/problems")
+        self.enabled = config.getboolean("Validation", "enabled", fallback=True)
+        self.process_pool_threshold = config.getint("Validation", "process_pool_threshold", fallback=4)
+        self.process_pool_min_bytes = config.getint("Validation", "process_pool_min_mb", fallback=64) * 1024 * 1024
+        self.max_workers = config.getint("Validation", "max_workers", fallback=0) or None
+        header_marker = config.get("Validation", "header_marker", fallback="")
+        footer_marker = config.get("Validation", "footer_marker", fallback="")
+        self.rules = {
+            "header_marker": header_marker,
+            "header": self._encode_marker("header_marker", header_marker),
+            "footer_marker": footer_marker,
+            "footer": self._encode_marker("footer_marker", footer_marker),
+            "max_unexpected_percent": config.getfloat("Validation", "max_unexpected_percent", fallback=5),
+            "min_size_bytes": config.getint("Validation", "min_size_bytes", fallback=1),
+            "min_lines": config.getint("Validation", "min_lines", fallback=0),
+            "max_line_length": config.getint("Validation", "max_line_length", fallback=0),
+            "line_pattern": self._compile_pattern(config.get("Validation", "line_pattern", fallback="")),
+            "line_buffer_limit": config.getint("Validation", "max_line_buffer_kb", fallback=1024) * 1024,
+            "chunk_size": config.getint("Validation", "chunk_size_kb", fallback=64) * 1024,
+            "mmap_threshold": config.getint("Validation", "mmap_threshold_mb", fallback=16) * 1024 * 1024,
+        }
+        self.notifier = Notifier()
+
+    def _read_config(self):
+        """Читает настройки из config.ini."""
+        config = ConfigParser()
+        config.read("config.ini", encoding="utf-8")
+        return config
+
+    def _encode_marker(self, name, marker):
+        """Кодирует маркер в cp1251; при ошибке отключает проверку этого маркера."""
+        try:
+            return marker.encode("cp1251")
+        except UnicodeEncodeError as e:
+            logger.error(f"Маркер {name} не кодируется в cp1251 ({e}). Проверка маркера отключена.")
+            return b""
+
+    def _compile_pattern(self, pattern):
+        """Компилирует шаблон строки; при ошибке отключает проверку по шаблону."""
+        if not pattern:
+            return None
+        try:
+            return re.compile(pattern.encode("cp1251"))
+        except (UnicodeEncodeError, re.error) as e:
+            logger.error(f"Некорректный шаблон line_pattern «{pattern}» ({e}). Проверка строк по шаблону отключена.")
+            return None
+
+    async def validate_files(self, remote_sizes=None, file_names=None):
+        """
+        Проверяет загруженные файлы .dat перед запуском sdexch1c.exe.
+        Некорректные файлы перемещаются в папку проблем вместе с описанием причины.
+        :param remote_sizes: словарь {имя файла: размер на FTP в байтах}
+        :param file_names: проверить только эти файлы (по умолчанию — все файлы .dat в папке)
+        """
+        if not self.enabled:
+            logger.info("Предварительная проверка файлов отключена.")
+            return
+
+        if not os.path.exists(self.local_input_path):
+            logger.error(f"Путь к локальной папке с файлами не найден: {self.local_input_path}")
+            return
+
+        remote_sizes = remote_sizes or {}
+        dat_files = [f for f in os.listdir(self.local_input_path) if f.endswith(".dat")]
+        if file_names is not None:
+            dat_files = [f for f in dat_files if f in file_names]
+        if not dat_files:
+            logger.info("Нет файлов .dat для предварительной проверки.")
+            return
+
+        logger.info(f"Предварительная проверка {len(dat_files)} файл(ов) .dat...")
+        paths = [os.path.join(self.local_input_path, f) for f in dat_files]
+        expected_sizes = [remote_sizes.get(f) for f in dat_files]
+        rules = [self.rules] * len(paths)
+
+        # Запуск процессов-исполнителей дорог (на Windows каждый заново импортирует программу),
+        # поэтому пул используется только для объёмных пакетов
+        total_bytes = sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+        if len(paths) >= self.process_pool_threshold and total_bytes >= self.process_pool_min_bytes:
+            logger.info(f"Проверка выполняется в пуле процессов ({len(paths)} файлов, {total_bytes // (1024 * 1024)} МБ).")
+            loop = asyncio.get_running_loop()
+            try:
+                with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                    reasons = await asyncio.gather(*[
+                        loop.run_in_executor(executor, _validate_file, path, size, rule)
+                        for path, size, rule in zip(paths, expected_sizes, rules)
+                    ])
+            except Exception as e:
+                # Сбой пула (BrokenProcessPool, ошибка запуска или сериализации) не должен прерывать цикл
+                logger.error(f"Ошибка пула процессов при проверке файлов: {e}. Проверка выполняется последовательно.")
+                reasons = [_validate_file(path, size, rule) for path, size, rule in zip(paths, expected_sizes, rules)]
+        else:
+            reasons = [_validate_file(path, size, rule) for path, size, rule in zip(paths, expected_sizes, rules)]
+
+        problematic_files = []
+        for dat_file, dat_file_path, reason in zip(dat_files, paths, reasons):
+            if reason is None:
+                logger.info(f"Файл {dat_file} прошёл предварительную проверку.")
+                continue
+
+            logger.warning(f"Файл {dat_file} не прошёл предварительную проверку: {reason}")
+            new_dat_path = self._move_file(dat_file_path, self.local_problem_path)
+            if new_dat_path:
+                reason_path = self._write_reason(new_dat_path, reason)
+                problematic_files.append((new_dat_path, [reason_path] if reason_path else []))
+
+        if problematic_files:
+            logger.info(f"Отклонено {len(problematic_files)} файл(ов) на этапе предварительной проверки.")
+            try:
+                self.notifier.send_batch_email(problematic_files)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке письма: {e}")
+        else:
+            logger.info("Все файлы прошли предварительную проверку.")
+
+    def _write_reason(self, dat_file_path, reason):
+        """Сохраняет причину отказа рядом с файлом в папке проблем и возвращает путь к ней."""
+        reason_path = f"{dat_file_path}.validation.txt"
+        try:
+            with open(reason_path, "w", encoding="cp1251", errors="replace") as f:
+                f.write(f"Файл {os.path.basename(dat_file_path)} отклонён до обработки в sdexch1c.\n")
+                f.write(f"Причина: {reason}\n")
+            return reason_path
+        except Exception as e:
+            logger.error(f"Ошибка при записи причины отказа для {dat_file_path}: {e}")
+            return None
+
+    def _move_file(self, file_path, target_folder):
+        """Перемещает файл в целевую папку и возвращает новый путь."""
+        os.makedirs(target_folder, exist_ok=True)
+        target_path = os.path.join(target_folder, os.path.basename(file_path))
+        try:
+            shutil.move(file_path, target_path)
+            logger.info(f"Файл {file_path} перемещен в {target_folder}.")
+            return target_path
+        except Exception as e:
+            logger.error(f"Ошибка при перемещении файла {file_path} в {target_folder}: {e}")
+            return None
@@ -1,5 +1,7 @@
 import os
 import socket
+import calendar
+from datetime import datetime
 from ftplib import FTP, error_perm
 from logger import logger
 from config_reader import ConfigReader
@@ -17,6 +19,9 @@ class FTPHandler:
         self.archive_path = config["FTP"]["archive_path"]
         self.local_input_path = config["Paths"]["local_input_path"]
         self.ftp = None
+        self.remote_sizes = {}  # Размеры загруженных файлов на FTP для предварительной проверки
+        self.downloaded_files = []  # Файлы, загруженные в текущем цикле; только они архивируются
+        self.last_check_failed = False  # Последняя проверка FTP завершилась ошибкой подключения или загрузки
         self.max_retries = 3  # Максимальное количество попыток подключения
         self.check_interval_minutes = int(config["General"]["check_interval_minutes"])
 
@@ -61,12 +66,25 @@ class FTPHandler:
             logger.warning(f"Хост {host}:{port} недоступен: {e}")
             return False
 
-    async def find_and_download_files(self):
+    async def find_and_download_files(self, skip_files=None):
         """
         Ищет файлы на FTP, загружает их в локальную папку и возвращает True, если файлы найдены.
+        :param skip_files: имена уже загруженных в этом цикле файлов; если задан,
+                           загружаются только новые файлы, а список загруженных дополняется
         """
+        if skip_files is None:
+            self.remote_sizes = {}
+            self.downloaded_files = []
+        else:
+            skip_files = set(skip_files)
+
+        self.last_check_failed = False
         if not self.ftp:
             await self.connect()
+        if not self.ftp:
+            logger.error("Поиск файлов на FTP невозможен: нет подключения к серверу.")
+            self.last_check_failed = True
+            return False
 
         try:
             logger.info("Поиск файлов на FTP...")
@@ -83,29 +101,58 @@ class FTPHandler:
             # Получение списка файлов на FTP
             files = self.ftp.nlst()
             logger.info(f"Список файлов в текущей директории: {files}")
-            dat_files = [file for file in files if file.endswith(".dat")]
+            dat_files = [file for file in files if file.endswith(".dat") and file not in (skip_files or ())]
 
             if not dat_files:
                 logger.info("На FTP нет новых файлов для загрузки.")
                 return False
 
+            # Двоичный режим нужен для корректного ответа на команду SIZE
+            self.ftp.voidcmd("TYPE I")
+
             for file in dat_files:
                 local_file_path = os.path.join(self.local_input_path, file)
+                try:
+                    self.remote_sizes[file] = self.ftp.size(file)
+                except Exception as e:
+                    logger.warning(f"Не удалось получить размер файла {file} на FTP: {e}")
                 logger.info(f"Загрузка файла {file} в {local_file_path}...")
-                with open(local_file_path, "wb") as local_file:
-                    self.ftp.retrbinary(f"RETR {file}", local_file.write)
+                try:
+                    with open(local_file_path, "wb") as local_file:
+                        self.ftp.retrbinary(f"RETR {file}", local_file.write)
+                except Exception:
+                    # Не оставляем недокачанный файл: он не должен попасть в обработку
+                    if os.path.exists(local_file_path):
+                        os.remove(local_file_path)
+                        logger.warning(f"Недокачанный файл {local_file_path} удалён.")
+                    raise
                 logger.info(f"Файл {file} успешно загружен в {local_file_path}.")
+                self._apply_remote_mtime(file, local_file_path)
+                self.downloaded_files.append(file)
 
             return True
         except error_perm as e:
             logger.error(f"Ошибка доступа к файлам на FTP: {e}")
+            self.last_check_failed = True
             return False
         except Exception as e:
             logger.error(f"Ошибка при загрузке файлов с FTP: {e}")
+            self.last_check_failed = True
             return False
         finally:
             await self.disconnect()
 
+    def _apply_remote_mtime(self, file, local_file_path):
+        """Переносит время изменения файла на FTP (MDTM) на локальную копию, чтобы сохранить возраст файла."""
+        try:
+            response = self.ftp.voidcmd(f"MDTM {file}")
+            # Ответ вида "213 YYYYMMDDHHMMSS[.sss]", время в UTC
+            remote_time = datetime.strptime(response.split()[1][:14], "%Y%m%d%H%M%S")
+            timestamp = calendar.timegm(remote_time.timetuple())
+            os.utime(local_file_path, (timestamp, timestamp))
+        except Exception as e:
+            logger.warning(f"Не удалось получить время изменения файла {file} на FTP: {e}")
+
     async def disconnect(self):
         """Закрывает соединение с FTP-сервером."""
         if not self.ftp:
@@ -143,7 +190,11 @@ class FTPHandler:
         logger.info(f"Возвращение в рабочую директорию: {self.remote_path}")
 
     async def archive_downloaded_files(self):
-        """Перемещает обработанные файлы *.dat на FTP в папку архива."""
+        """
+        Перемещает обработанные файлы *.dat на FTP в папку архива.
+        Архивируются только файлы, загруженные в текущем цикле: файлы, появившиеся
+        на FTP во время обработки, остаются до следующего цикла.
+        """
         if not self.ftp:
             await self.connect()
 
@@ -155,7 +206,7 @@ class FTPHandler:
 
             # Получаем список файлов в текущей директории
             files = self.ftp.nlst()
-            dat_files = [file for file in files if file.endswith(".dat")]
+            dat_files = [file for file in files if file.endswith(".dat") and file in self.downloaded_files]
 
             if not dat_files:
                 logger.info("Нет файлов для архивации.")
@@ -2,15 +2,31 @@ import asyncio
 from ftp_handler import FTPHandler
 from process_monitor import ProcessMonitor
 from file_processor import FileProcessor
+from file_validator import FileValidator
 from result_analyzer import ResultAnalyzer
 from logger import logger
 
 async def main():
     ftp_handler = FTPHandler()
     process_monitor = ProcessMonitor()
+    file_validator = FileValidator()
     file_processor = FileProcessor()
     result_analyzer = ResultAnalyzer()
 
+    async def fetch_new_files():
+        """
+        Загружает файлы, появившиеся на FTP во время обработки, и проверяет их.
+        Возвращает False, если FTP недоступен: до конца цикла повторные проверки не выполняются.
+        """
+        known_files = set(ftp_handler.downloaded_files)
+        await ftp_handler.find_and_download_files(skip_files=known_files)
+        # Проверяем все новые файлы, даже если загрузка части файлов завершилась ошибкой
+        new_files = [f for f in ftp_handler.downloaded_files if f not in known_files]
+        if new_files:
+            logger.info(f"Во время обработки появились новые файлы: {new_files}")
+            await file_validator.validate_files(ftp_handler.remote_sizes, new_files)
+        return not ftp_handler.last_check_failed
+
     while True:
         try:
             # Проверяем FTP на наличие новых файлов
@@ -20,11 +36,15 @@ async def main():
             if new_files_found:
                 logger.info("Найдены новые файлы. Запуск процесса обработки...")
 
+                # Отсекаем пустые, обрезанные и некорректные файлы до запуска утилиты
+                await file_validator.validate_files(ftp_handler.remote_sizes)
+
                 # Проверяем готовность SELEX
                 await process_monitor.ensure_selex_ready()
 
-                # Обрабатываем файлы
-                await file_processor.process_files()
+                # Обрабатываем файлы пакетами; между пакетами забираем новые файлы с FTP
+                # и перед каждым следующим пакетом повторно проверяем готовность SELEX
+                await file_processor.process_files(fetch_new_files, process_monitor.ensure_selex_ready)
 
                 # Анализируем результаты (и уведомляем, если есть проблемные файлы)
                 await result_analyzer.analyze_results()